@@ -0,0 +1,145 @@
+"""Бенчмарк пропускной способности broadcast_to_lobby в зависимости от размера пула.
+
+Поднимает локальный поддельный Bot API (HTTP/1.1 с keep-alive и заданной
+задержкой ответа) и рассылает сообщения лобби из N игроков через
+PooledRequest с разными размерами пула. Число воркеров очереди рассылки
+для каждого пула считается так же, как в боте по умолчанию
+(outbox_workers_for); если в боте задан SPY_OUTBOX_WORKERS, параллельность
+рассылки ограничена им, а не размером пула.
+
+Пример:
+    python bench_pool.py --players 40 --rounds 5 --latency 0.05 --pools 4 8 16 32 64
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from telegram import Bot
+
+import bot as bot_module
+from http_pool import REPLY_HEADROOM, PooledRequest, outbox_workers_for
+from outbox import Outbox
+
+
+class FakeBotAPI:
+    """Минимальный HTTP-сервер, отвечающий как Bot API"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Spy", "username": "spy_bench_bot"}
+        if method == "sendMessage":
+            return {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                path = lines[0].split(" ")[1]
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                params = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+                await asyncio.sleep(self.latency)
+
+                method = path.rsplit("/", 1)[-1]
+                payload = json.dumps({"ok": True, "result": self._result(method, params)}).encode("utf-8")
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(payload)).encode() + b"\r\n"
+                    b"Connection: keep-alive\r\n\r\n" + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+async def bench(api: FakeBotAPI, pool_size: int, players: int, rounds: int) -> dict:
+    request = PooledRequest("send", pool_size=pool_size, pool_timeout=None)
+    workers = outbox_workers_for(pool_size)
+    outbox = bot_module.outbox = Outbox(workers)
+    bot = Bot("1:bench", base_url=f"http://127.0.0.1:{api.port}/bot", request=request)
+    lobby = SimpleNamespace(players=[
+        SimpleNamespace(user_id=1000 + i, display_name=f"Игрок {i}") for i in range(players)
+    ])
+
+    async with bot:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            bot_module.broadcast_to_lobby(bot, lobby, "🎮 Игра началась!")
+            await outbox.join()
+        elapsed = time.perf_counter() - started
+        await outbox.drain(0)
+
+    stats = request.stats()
+    sent = players * rounds
+    return {
+        "pool_size": pool_size,
+        "workers": workers,
+        "messages": sent,
+        "seconds": elapsed,
+        "per_second": sent / elapsed,
+        "wait_mean_ms": stats["wait_mean_ms"],
+        "wait_max_ms": stats["wait_max_ms"],
+    }
+
+
+async def run(args):
+    if min(args.pools) <= REPLY_HEADROOM:
+        raise SystemExit(f"Размер пула должен быть не меньше {REPLY_HEADROOM + 1}")
+    api = FakeBotAPI(args.latency)
+    await api.start()
+    try:
+        print(f"Игроков: {args.players}, рассылок: {args.rounds}, задержка API: {args.latency * 1000:.0f} мс\n")
+        print(f"{'пул':>5}{'воркеров':>10}{'сообщ/с':>10}{'время, с':>10}{'ожид. сред, мс':>16}{'ожид. макс, мс':>16}")
+        for pool_size in args.pools:
+            result = await bench(api, pool_size, args.players, args.rounds)
+            print(
+                f"{result['pool_size']:>5}{result['workers']:>10}{result['per_second']:>10.1f}{result['seconds']:>10.2f}"
+                f"{result['wait_mean_ms']:>16.1f}{result['wait_max_ms']:>16.1f}"
+            )
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылки по размеру пула соединений")
+    parser.add_argument("--players", type=int, default=40, help="игроков в лобби")
+    parser.add_argument("--rounds", type=int, default=5, help="рассылок на каждый размер пула")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа API, с")
+    parser.add_argument("--pools", type=int, nargs="+", default=[4, 8, 16, 32, 64],
+                        help="размеры пула для сравнения")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Сравнение доставки ролей: pull (/role от каждого игрока) и push (рассылка при старте).
+
+Прогоняет через обработчики бота один раунд (/startgame и, в режиме pull,
+/role от каждого игрока) с подставным Bot API из replay.py и считает
+входящие обновления и исходящие вызовы API за раунд.
+
+Пример:
+    python bench_roles.py --players 4 8 16
+"""
+import argparse
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import Application
+
+import bot
+from game_logic import GameManager
+from replay import FakeRequest
+
+ORGANIZER_ID = 1
+
+
+def command_update(update_id: int, user_id: int, text: str) -> dict:
+    command = text.split(" ", 1)[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Игрок {user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+async def run_round(mode: str, players: int) -> dict:
+    bot.ROLE_DELIVERY = mode
+    bot.game_manager = GameManager()
+    bot.role_messages.clear()
+
+    request = FakeRequest()
+    application = Application.builder().token("1:bench").request(request).updater(None).build()
+    bot.register_handlers(application)
+
+    update_id = 0
+
+    async def send(user_id: int, text: str):
+        nonlocal update_id
+        update_id += 1
+        update = Update.de_json(command_update(update_id, user_id, text), application.bot)
+        await application.process_update(update)
+        await bot.outbox.join()
+
+    async with application:
+        # Подготовка лобби в статистику раунда не входит
+        await send(ORGANIZER_ID, "/create")
+        lobby_id = next(iter(bot.game_manager.lobbies))
+        player_ids = [100 + i for i in range(players)]
+        for user_id in player_ids:
+            await send(user_id, f"/join {lobby_id}")
+
+        request.calls.clear()
+        first_update_id = update_id
+        started = time.perf_counter()
+
+        await send(ORGANIZER_ID, "/startgame")
+        if mode == "pull":
+            for user_id in player_ids:
+                await send(user_id, "/role")
+
+        elapsed = time.perf_counter() - started
+
+    return {
+        "inbound": update_id - first_update_id,
+        "outbound": sum(request.calls.values()),
+        "ms": elapsed * 1000,
+    }
+
+
+async def run(args):
+    print(f"{'игроков':>8}{'режим':>7}{'входящих':>10}{'исходящих':>11}{'время, мс':>11}")
+    for players in args.players:
+        for mode in ("pull", "push"):
+            result = await run_round(mode, players)
+            print(
+                f"{players:>8}{mode:>7}{result['inbound']:>10}"
+                f"{result['outbound']:>11}{result['ms']:>11.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение доставки ролей pull и push")
+    parser.add_argument("--players", type=int, nargs="+", default=[4, 8, 16],
+                        help="размеры лобби для сравнения")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,50 @@
+import asyncio
+import math
 import os
+import signal
 from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, TypeHandler
 from game_logic import GameManager, GameResult, Lobby
+from http_pool import outbox_workers, requests_from_env
+from outbox import Outbox
+from profiler import SamplingProfiler
+from recorder import UpdateRecorder
+from snapshot import dumps_game_manager, load_snapshot, save_snapshot
 
 # Инициализация менеджера игр
 game_manager = GameManager()
 
+# Очередь исходящих сообщений (воркеров на REPLY_HEADROOM меньше, чем соединений в пуле, -
+# остаётся запас для ответов)
+outbox = Outbox(outbox_workers())
 
-async def broadcast_to_lobby(bot: Bot, lobby: Lobby, message: str):
-    """Отправить сообщение всем игрокам в лобби"""
+# Файл состояния для перезапуска и дедлайн отправки очереди при остановке
+STATE_FILE = os.getenv("SPY_STATE_FILE", "spy_state.pkl")
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SPY_SHUTDOWN_DRAIN_SECONDS", "10"))
+
+# Неотправленные сообщения старше этого срока при запуске не отправляются
+PENDING_MAX_AGE_SECONDS = float(os.getenv("SPY_PENDING_MAX_AGE_SECONDS", "300"))
+
+# Доставка ролей: "pull" - игроки запрашивают роль через /role,
+# "push" - роли рассылаются всем сразу при старте игры
+ROLE_DELIVERY = os.getenv("SPY_ROLE_DELIVERY", "pull")
+
+# Разосланные при старте сообщения с ролями: lobby_id -> {user_id: (текст, кнопки)}
+role_messages = {}
+
+# Профайлер для диагностики (/profile, SIGUSR1)
+profiler = SamplingProfiler()
+
+# Администраторы бота (ID через запятую)
+ADMIN_IDS = {int(x) for x in os.getenv("SPY_ADMIN_IDS", "").split(",") if x.strip()}
+
+
+def broadcast_to_lobby(bot: Bot, lobby: Lobby, message: str):
+    """Поставить сообщение всем игрокам в лобби в очередь на отправку"""
+    # Доставку не ждём: сообщения разным игрокам уходят параллельно,
+    # насколько позволяет число воркеров очереди
     for player in lobby.players:
-        try:
-            await bot.send_message(chat_id=player.user_id, text=message)
-        except Exception as e:
-            print(f"Не удалось отправить сообщение игроку {player.display_name}: {e}")
+        outbox.put(bot, player.user_id, message)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -79,7 +110,7 @@ async def join(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Уведомляем всех игроков о новом участнике
         player = lobby.get_player(user_id)
-        await broadcast_to_lobby(
+        broadcast_to_lobby(
             context.application.bot,
             lobby,
             f"➕ {player.display_name} присоединился к игре!\n👥 Игроков: {len(lobby.players)}"
@@ -111,10 +142,11 @@ async def leave(update: Update, context: ContextTypes.DEFAULT_TYPE):
     player_name = player.display_name if player else "Игрок"
     
     if user_lobby.remove_player(user_id):
+        role_messages.pop(user_lobby.lobby_id, None)
         await update.message.reply_text(f"✅ Вы покинули лобби {user_lobby.lobby_id}")
         
         # Уведомляем остальных игроков
-        await broadcast_to_lobby(
+        broadcast_to_lobby(
             context.application.bot,
             user_lobby,
             f"➖ {player_name} покинул игру\n👥 Игроков: {len(user_lobby.players)}"
@@ -212,7 +244,7 @@ async def addplace(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"✅ Место работы '{workplace}' добавлено!")
         
         # Уведомляем всех
-        await broadcast_to_lobby(
+        broadcast_to_lobby(
             context.application.bot,
             user_lobby,
             f"➕ Добавлено новое место: {workplace}"
@@ -260,6 +292,16 @@ async def places(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(message)
 
 
+def game_started_header(lobby: Lobby) -> str:
+    """Начало сообщения о старте игры: число игроков и ролей"""
+    return (
+        f"🎮 Игра началась!\n\n"
+        f"👥 Игроков: {len(lobby.players)}\n"
+        f"🕵️ Шпион: 1\n"
+        f"👷 Работники: {len(lobby.players) - 1}\n\n"
+    )
+
+
 async def startgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начать игру (только организатор)"""
     user_id = update.effective_user.id
@@ -276,27 +318,26 @@ async def startgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if organizer_lobby.start_game():
+        roles_hint = "Роли разосланы игрокам" if ROLE_DELIVERY == "push" else "Игроки узнают роли через /role"
+        
         # Сообщение для организатора с подсказкой
         await update.message.reply_text(
-            f"🎮 Игра началась!\n\n"
-            f"👥 Игроков: {len(organizer_lobby.players)}\n"
-            f"🕵️ Шпион: 1\n"
-            f"👷 Работники: {len(organizer_lobby.players) - 1}\n\n"
+            game_started_header(organizer_lobby) +
             f"💡 Подсказки:\n"
-            f"• Игроки узнают роли через /role\n"
+            f"• {roles_hint}\n"
             f"• Игроки сами останавливают игру через кнопки\n"
             f"• Или вы можете объявить: /win workers или /win spy"
         )
         
+        if ROLE_DELIVERY == "push":
+            deliver_roles(context.application.bot, organizer_lobby)
+            return
+        
         # Общее сообщение всем игрокам
-        await broadcast_to_lobby(
+        broadcast_to_lobby(
             context.application.bot,
             organizer_lobby,
-            f"🎮 Игра началась!\n\n"
-            f"👥 Игроков: {len(organizer_lobby.players)}\n"
-            f"🕵️ Шпион: 1\n"
-            f"👷 Работники: {len(organizer_lobby.players) - 1}\n\n"
-            f"Узнайте свою роль командой /role"
+            game_started_header(organizer_lobby) + "Узнайте свою роль командой /role"
         )
     else:
         if organizer_lobby.game_started:
@@ -320,16 +361,28 @@ async def role(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Вы не находитесь ни в одном лобби")
         return
     
+    # Роль уже разослана при старте - отправляем её повторно
+    cached = role_messages.get(user_lobby.lobby_id, {}).get(user_id)
+    if cached and user_lobby.game_started and not user_lobby.game_stopped:
+        message, reply_markup = cached
+        await update.message.reply_text(message, reply_markup=reply_markup)
+        return
+    
     role_info = user_lobby.get_player_role_info(user_id)
     
     if not role_info:
         await update.message.reply_text("❌ Игра ещё не началась. Ждите команды /startgame от организатора")
         return
     
+    message, reply_markup = build_role_message(user_lobby, role_info)
+    await update.message.reply_text(message, reply_markup=reply_markup)
+
+
+def build_role_message(lobby: Lobby, role_info: dict):
+    """Текст сообщения с ролью игрока и кнопка остановки игры"""
     # Создаём кнопку для остановки игры (если игра не остановлена)
-    keyboard = None
-    if not user_lobby.game_stopped:
-        keyboard = [[InlineKeyboardButton("⏸️ Остановить игру", callback_data=f"stop_{user_lobby.lobby_id}")]]
+    if not lobby.game_stopped:
+        keyboard = [[InlineKeyboardButton("⏸️ Остановить игру", callback_data=f"stop_{lobby.lobby_id}")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
     else:
         reply_markup = None
@@ -339,17 +392,35 @@ async def role(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message += f"👥 Всего игроков: {role_info['player_count']}\n"
         message += "🎯 Ваша цель: узнать место работы других игроков\n\n"
         message += "⚠️ Вы НЕ знаете, где работают остальные!"
-        if not user_lobby.game_stopped:
+        if not lobby.game_stopped:
             message += "\n\n💡 Когда будете готовы угадать место - нажмите кнопку ниже"
     else:
         message = "👷 Вы - РАБОТНИК!\n\n"
         message += f"🏢 Место работы: {role_info['workplace']}\n"
         message += f"👥 Всего игроков: {role_info['player_count']}\n"
         message += "🎯 Ваша цель: найти шпиона среди коллег"
-        if not user_lobby.game_stopped:
+        if not lobby.game_stopped:
             message += "\n\n💡 Когда найдёте шпиона - нажмите кнопку ниже"
     
-    await update.message.reply_text(message, reply_markup=reply_markup)
+    return message, reply_markup
+
+
+def deliver_roles(bot: Bot, lobby: Lobby):
+    """Разослать всем игрокам сообщение о старте игры вместе с их ролью"""
+    header = game_started_header(lobby)
+    
+    # Сообщений всего два вида - для шпиона и для работников, строим их один раз
+    by_role = {}
+    messages = {}
+    for player in lobby.players:
+        if player.is_spy not in by_role:
+            by_role[player.is_spy] = build_role_message(lobby, lobby.get_player_role_info(player.user_id))
+        messages[player.user_id] = by_role[player.is_spy]
+    role_messages[lobby.lobby_id] = messages
+    
+    for player in lobby.players:
+        message, reply_markup = messages[player.user_id]
+        outbox.put(bot, player.user_id, header + message, reply_markup)
 
 
 async def stopgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -436,7 +507,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 
                 # Уведомляем всех
-                await broadcast_to_lobby(
+                broadcast_to_lobby(
                     context.application.bot,
                     lobby,
                     f"⏸️ {player.display_name} остановил игру!\n\n"
@@ -463,6 +534,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         accused = lobby.get_player(accused_id)
         
         if result:
+            # Раунд завершён - разосланные роли больше не нужны
+            role_messages.pop(lobby.lobby_id, None)
+            
             await query.edit_message_text(
                 f"⏸️ Вы обвинили {accused.display_name}!\n\n"
                 f"Ожидайте результата..."
@@ -482,7 +556,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 message += f"🎉 ПОБЕДА ШПИОНА!\n"
                 message += f"🏢 Место работы было: {lobby.current_workplace}"
             
-            await broadcast_to_lobby(context.application.bot, lobby, message)
+            broadcast_to_lobby(context.application.bot, lobby, message)
         else:
             await query.edit_message_text("❌ Не удалось обвинить игрока")
     
@@ -510,6 +584,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             result = lobby.get_vote_result()
             if result:
                 # Все проголосовали, объявляем результат
+                role_messages.pop(lobby.lobby_id, None)
                 workers_count = len(lobby.get_workers())
                 yes_votes = sum(1 for v in lobby.votes.values() if v)
                 no_votes = workers_count - yes_votes
@@ -529,7 +604,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     message += f"❌ Неправильная догадка: {lobby.guessed_workplace}\n"
                     message += f"🏢 Настоящее место: {lobby.current_workplace}"
                 
-                await broadcast_to_lobby(context.application.bot, lobby, message)
+                broadcast_to_lobby(context.application.bot, lobby, message)
         else:
             await query.edit_message_text("❌ Не удалось проголосовать")
 
@@ -587,14 +662,7 @@ async def guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message += f"(Для победы шпиона нужно больше половины голосов 'Да')"
         
         for worker in workers:
-            try:
-                await context.application.bot.send_message(
-                    chat_id=worker.user_id,
-                    text=message,
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                print(f"Не удалось отправить сообщение работнику {worker.display_name}: {e}")
+            outbox.put(context.application.bot, worker.user_id, message, reply_markup)
     else:
         await update.message.reply_text("❌ Не удалось установить догадку")
 
@@ -642,7 +710,8 @@ async def win(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message += f"🏢 Место работы было: {workplace}"
         
         organizer_lobby.end_game(GameResult.WORKERS_WIN)
-        await broadcast_to_lobby(context.application.bot, organizer_lobby, message)
+        role_messages.pop(organizer_lobby.lobby_id, None)
+        broadcast_to_lobby(context.application.bot, organizer_lobby, message)
         
     elif winner == "spy":
         spy_name = organizer_lobby.spy.display_name if organizer_lobby.spy else "Неизвестно"
@@ -662,7 +731,8 @@ async def win(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message += f"🏢 Место работы было: {workplace}"
         
         organizer_lobby.end_game(GameResult.SPY_WIN)
-        await broadcast_to_lobby(context.application.bot, organizer_lobby, message)
+        role_messages.pop(organizer_lobby.lobby_id, None)
+        broadcast_to_lobby(context.application.bot, organizer_lobby, message)
         
     else:
         await update.message.reply_text("❌ Неверный параметр. Используйте: /win workers или /win spy")
@@ -691,6 +761,7 @@ async def endgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
     workplace = organizer_lobby.current_workplace
     
     organizer_lobby.end_game(GameResult.WORKERS_WIN)  # Технически завершаем игру
+    role_messages.pop(organizer_lobby.lobby_id, None)
     
     # Сообщение для организатора с подсказкой
     await update.message.reply_text(
@@ -701,7 +772,7 @@ async def endgame(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Общее сообщение всем игрокам
-    await broadcast_to_lobby(
+    broadcast_to_lobby(
         context.application.bot,
         organizer_lobby,
         f"⏹️ Игра завершена\n\n"
@@ -728,23 +799,149 @@ async def closelobby(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     game_manager.delete_lobby(lobby_id_to_delete)
+    role_messages.pop(lobby_id_to_delete, None)
     await update.message.reply_text(f"✅ Лобби {lobby_id_to_delete} закрыто")
 
 
-def main():
-    """Запуск бота"""
-    # Получаем токен из переменной окружения
-    TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "8325496741:AAFCyqOzmMgyV25-1Br2d1cR3wI_UHQPjYk")
+async def run_profile(duration: float) -> str:
+    """Снять профиль и вернуть краткий отчёт"""
+    result = await profiler.profile(duration)
+    return (
+        f"🔬 Профиль готов: {result['path']}\n"
+        f"📈 Сэмплов: {result['samples']}\n"
+        f"⏱️ Задержка цикла событий: сред. {result['lag_mean_ms']:.1f} мс, "
+        f"p99 {result['lag_p99_ms']:.1f} мс, макс. {result['lag_max_ms']:.1f} мс"
+    )
 
-    if not TOKEN:
-        print("❌ Ошибка: не установлена переменная окружения TELEGRAM_BOT_TOKEN")
-        print("Установите токен командой: export TELEGRAM_BOT_TOKEN='ваш_токен'")
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Снять профиль работающего бота (только администратор)"""
+    user_id = update.effective_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Команда доступна только администратору")
         return
     
-    # Создаём приложение
-    application = Application.builder().token(TOKEN).build()
+    duration = 10
+    if context.args:
+        try:
+            duration = float(context.args[0])
+        except ValueError:
+            duration = math.nan
+        if not math.isfinite(duration):
+            await update.message.reply_text("❌ Укажите длительность в секундах: /profile <секунды>")
+            return
+    duration = min(max(duration, 1), 60)
+    
+    # Занимаем профайлер сразу, чтобы повторная команда не запустила второй профиль
+    if not profiler.reserve():
+        await update.message.reply_text("❌ Профиль уже снимается")
+        return
+    
+    # Профиль снимается в фоне, чтобы не задерживать обработку обновлений
+    async def profile_and_report():
+        try:
+            report = await run_profile(duration)
+        except Exception as e:
+            report = f"❌ Не удалось снять профиль: {e}"
+        await update.message.reply_text(report)
     
-    # Регистрируем обработчики команд
+    context.application.create_task(profile_and_report(), update=update)
+    await update.message.reply_text(f"🔬 Снимаю профиль ({duration:g} с)...")
+
+
+async def poolstats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика пулов HTTP-соединений (только администратор)"""
+    user_id = update.effective_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Команда доступна только администратору")
+        return
+    
+    pools = context.application.bot_data.get("http_pools", [])
+    if not pools:
+        await update.message.reply_text("❌ Пулы соединений не настроены")
+        return
+    
+    message = "🔌 Пулы соединений:\n"
+    for request in pools:
+        stats = request.stats()
+        message += (
+            f"\n{stats['name']}: размер {stats['pool_size']}, запросов {stats['requests']}\n"
+            f"  ждали соединения: {stats['waited']}, "
+            f"сред. {stats['wait_mean_ms']:.1f} мс, макс. {stats['wait_max_ms']:.1f} мс\n"
+        )
+    
+    await update.message.reply_text(message)
+
+
+async def post_init(application: Application):
+    """Восстановить состояние после перезапуска и настроить профиль по SIGUSR1"""
+    global game_manager
+    
+    snapshot = load_snapshot(STATE_FILE)
+    if snapshot:
+        game_manager = snapshot["game_manager"]
+        restored = outbox.restore(application.bot, snapshot["pending"], PENDING_MAX_AGE_SECONDS)
+        print(
+            f"♻️ Состояние восстановлено: лобби {len(game_manager.lobbies)}, "
+            f"сообщений в очереди {restored} (устаревших пропущено: {len(snapshot['pending']) - restored})"
+        )
+        
+        # Журнал начинается не с пустого состояния - сохраняем его для replay.py
+        recorder = application.bot_data.get("recorder")
+        if recorder:
+            recorder.set_initial_state(dumps_game_manager(game_manager))
+            print("📼 Запись начинается с восстановленного состояния, оно сохранено в журнале")
+    
+    # Профиль по сигналу SIGUSR1 (длительность - SPY_PROFILE_SECONDS)
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    
+    duration = float(os.getenv("SPY_PROFILE_SECONDS", "10"))
+    
+    async def profile_and_print():
+        try:
+            print(await run_profile(duration))
+        except Exception as e:
+            print(f"❌ Не удалось снять профиль: {e}")
+    
+    def on_signal():
+        if profiler.reserve():
+            application.create_task(profile_and_print())
+        else:
+            print("❌ Профиль уже снимается")
+    
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, on_signal)
+
+
+async def post_stop(application: Application):
+    """Отправить очередь сообщений и сохранить состояние игр.
+
+    Вызывается после того, как бот перестал получать обновления
+    и закончил обработку уже полученных.
+    """
+    pending = await outbox.drain(SHUTDOWN_DRAIN_SECONDS)
+    
+    try:
+        save_snapshot(STATE_FILE, game_manager, pending)
+    except Exception as e:
+        print(f"❌ Не удалось сохранить состояние: {e}")
+        return
+    
+    print(f"💾 Состояние сохранено в {STATE_FILE}, неотправленных сообщений: {len(pending)}")
+
+
+async def post_shutdown(application: Application):
+    """Закрыть журнал записи обновлений"""
+    recorder = application.bot_data.get("recorder")
+    if recorder:
+        recorder.close()
+
+
+def register_handlers(application: Application):
+    """Зарегистрировать обработчики команд и кнопок"""
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", start))
     application.add_handler(CommandHandler("create", create))
@@ -761,9 +958,49 @@ def main():
     application.add_handler(CommandHandler("win", win))
     application.add_handler(CommandHandler("endgame", endgame))
     application.add_handler(CommandHandler("closelobby", closelobby))
+    application.add_handler(CommandHandler("profile", profile))
+    application.add_handler(CommandHandler("poolstats", poolstats))
     
     # Регистрируем обработчик кнопок
     application.add_handler(CallbackQueryHandler(button_handler))
+
+
+def main():
+    """Запуск бота"""
+    # Получаем токен из переменной окружения
+    TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "8325496741:AAFCyqOzmMgyV25-1Br2d1cR3wI_UHQPjYk")
+
+    if not TOKEN:
+        print("❌ Ошибка: не установлена переменная окружения TELEGRAM_BOT_TOKEN")
+        print("Установите токен командой: export TELEGRAM_BOT_TOKEN='ваш_токен'")
+        return
+    
+    # Отдельные пулы соединений для getUpdates и для отправки сообщений
+    send_request, updates_request = requests_from_env()
+    
+    # Создаём приложение
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .request(send_request)
+        .get_updates_request(updates_request)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.bot_data["http_pools"] = [send_request, updates_request]
+    
+    # Запись входящих обновлений для воспроизведения (replay.py)
+    record_file = os.getenv("SPY_RECORD_FILE")
+    if record_file:
+        recorder = UpdateRecorder(record_file)
+        application.add_handler(TypeHandler(Update, recorder.record), group=-1)
+        application.bot_data["recorder"] = recorder
+        print(f"📼 Запись обновлений в {record_file} (seed={recorder.seed})")
+    
+    # Регистрируем обработчики команд и кнопок
+    register_handlers(application)
     
     # Запускаем бота
     print("🤖 Бот запущен и готов к работе!")
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
+
+
+# Размер пула для отправки по умолчанию - как у ApplicationBuilder в python-telegram-bot
+DEFAULT_POOL_SIZE = 256
+
+# Соединения, которые очередь рассылки не занимает, чтобы ответы обработчиков
+# (reply_text, edit_message_text) не ждали окончания рассылки
+REPLY_HEADROOM = 2
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest с настраиваемым keep-alive и замером ожидания пула.
+
+    Перед отправкой запрос занимает слот в пуле (семафор по размеру пула
+    соединений), поэтому httpx сам никогда не ждёт свободного соединения,
+    а время ожидания слота можно измерить.
+    """
+
+    def __init__(self, name: str, pool_size: int = 1, keepalive_expiry: float = 5.0, **kwargs):
+        self.name = name
+        self.pool_size = pool_size
+        self._keepalive_expiry = keepalive_expiry
+        self._slots = asyncio.Semaphore(pool_size)
+        self.requests = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        super().__init__(connection_pool_size=pool_size, **kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = self._client_kwargs["limits"]
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=self._keepalive_expiry,
+        )
+        return super()._build_client()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data=None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ):
+        if pool_timeout is BaseRequest.DEFAULT_NONE:
+            timeout = self._client.timeout.pool
+        else:
+            timeout = pool_timeout
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError as exc:
+            raise TimedOut(
+                message=f"Pool timeout ({self.name}): все {self.pool_size} соединений заняты, "
+                "запрос не отправлен"
+            ) from exc
+        waited = time.perf_counter() - started
+
+        self.requests += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        if waited > 0.001:
+            self.waited += 1
+
+        try:
+            return await super().do_request(
+                url,
+                method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Статистика ожидания свободного соединения"""
+        return {
+            "name": self.name,
+            "pool_size": self.pool_size,
+            "requests": self.requests,
+            "waited": self.waited,
+            "wait_mean_ms": self.wait_total / self.requests * 1000 if self.requests else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+
+def requests_from_env():
+    """Создать отдельные пулы для отправки сообщений и для getUpdates.
+
+    Настройки (переменные окружения):
+        SPY_HTTP_POOL_SIZE          - размер пула для отправки (по умолчанию 256,
+                                      не меньше REPLY_HEADROOM + 1)
+        SPY_HTTP_UPDATES_POOL_SIZE  - размер пула для getUpdates (по умолчанию 1)
+        SPY_HTTP_KEEPALIVE          - время жизни простаивающего соединения, с (5)
+        SPY_HTTP_CONNECT_TIMEOUT    - таймаут соединения, с (5)
+        SPY_HTTP_READ_TIMEOUT       - таймаут чтения, с (5)
+        SPY_HTTP_WRITE_TIMEOUT      - таймаут записи, с (5)
+        SPY_HTTP_POOL_TIMEOUT       - таймаут ожидания соединения из пула, с (1)
+        SPY_HTTP2                   - 1, чтобы включить HTTP/2
+                                      (нужен python-telegram-bot[http2])
+    """
+    common = {
+        "keepalive_expiry": float(os.getenv("SPY_HTTP_KEEPALIVE", "5")),
+        "connect_timeout": float(os.getenv("SPY_HTTP_CONNECT_TIMEOUT", "5")),
+        "read_timeout": float(os.getenv("SPY_HTTP_READ_TIMEOUT", "5")),
+        "write_timeout": float(os.getenv("SPY_HTTP_WRITE_TIMEOUT", "5")),
+        "pool_timeout": float(os.getenv("SPY_HTTP_POOL_TIMEOUT", "1")),
+        "http_version": "2" if os.getenv("SPY_HTTP2") == "1" else "1.1",
+    }
+    send_request = PooledRequest("send", pool_size=send_pool_size(), **common)
+    updates_request = PooledRequest(
+        "updates", pool_size=int(os.getenv("SPY_HTTP_UPDATES_POOL_SIZE", "1")), **common
+    )
+    return send_request, updates_request
+
+
+def send_pool_size() -> int:
+    """Размер пула для отправки сообщений (SPY_HTTP_POOL_SIZE)"""
+    pool_size = int(os.getenv("SPY_HTTP_POOL_SIZE", str(DEFAULT_POOL_SIZE)))
+    if pool_size <= REPLY_HEADROOM:
+        raise ValueError(
+            f"SPY_HTTP_POOL_SIZE должен быть не меньше {REPLY_HEADROOM + 1}: "
+            f"{REPLY_HEADROOM} соединения остаются для ответов обработчиков"
+        )
+    return pool_size
+
+
+def outbox_workers_for(pool_size: int) -> int:
+    """Число воркеров очереди рассылки для пула заданного размера.
+
+    Рассылка занимает все соединения пула, кроме REPLY_HEADROOM, так что
+    её пропускная способность растёт вместе с размером пула.
+    """
+    return pool_size - REPLY_HEADROOM
+
+
+def outbox_workers() -> int:
+    """Число воркеров очереди рассылки.
+
+    По умолчанию выводится из SPY_HTTP_POOL_SIZE. SPY_OUTBOX_WORKERS задаёт
+    его явно и ограничивает параллельность рассылки независимо от размера пула.
+    """
+    default = outbox_workers_for(send_pool_size())
+    return int(os.getenv("SPY_OUTBOX_WORKERS", str(default)))
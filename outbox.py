@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+
+class Outbox:
+    """Очередь исходящих сообщений.
+
+    Сообщения раскладываются по очередям воркеров по chat_id, так что
+    сообщения одному игроку уходят по порядку, а разным игрокам - параллельно.
+    При остановке бота очередь дожидается отправки в пределах дедлайна,
+    а неотправленное возвращает для сохранения.
+
+    На RetryAfter воркер ждёт, сколько просит Telegram, и повторяет отправку,
+    сетевые ошибки повторяются до max_retries раз. Если сообщение так и не
+    ушло или ошибка постоянная (Forbidden, BadRequest и прочие), оно
+    отбрасывается, чтобы не задерживать следующие сообщения этому игроку.
+    """
+
+    def __init__(self, workers: int = 8, max_retries: int = 3, retry_delay: float = 1.0):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queues = []
+        self._tasks = []
+        self._in_flight = []
+
+    def _start(self):
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._in_flight = [None] * self.workers
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"outbox-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def _worker(self, index: int):
+        queue = self._queues[index]
+        while True:
+            item = await queue.get()
+            self._in_flight[index] = item
+            await self._send(item)
+            # При отмене воркера сообщение остаётся в _in_flight и будет сохранено
+            self._in_flight[index] = None
+            queue.task_done()
+
+    async def _send(self, item):
+        """Отправить сообщение, повторяя при временных ошибках"""
+        bot, chat_id, text, reply_markup, _ = item
+        attempt = 0
+        while True:
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+                return
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован или сообщение некорректно - повтор не поможет
+                print(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except NetworkError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    print(f"Не удалось отправить сообщение в чат {chat_id} после {attempt} попыток: {e}")
+                    return
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            except Exception as e:
+                print(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                return
+
+    def put(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        reply_markup: InlineKeyboardMarkup = None,
+        queued_at: float = None,
+    ):
+        """Поставить сообщение в очередь на отправку"""
+        if not self._tasks:
+            self._start()
+        if queued_at is None:
+            queued_at = time.time()
+        self._queues[chat_id % self.workers].put_nowait((bot, chat_id, text, reply_markup, queued_at))
+
+    async def join(self):
+        """Дождаться отправки всех сообщений из очереди"""
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def drain(self, timeout: float) -> list:
+        """Отправить что успеем за timeout секунд, вернуть неотправленное"""
+        if not self._tasks:
+            return []
+
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        # Прерванные на лету сообщения тоже считаем неотправленными
+        pending = [item for item in self._in_flight if item is not None]
+        for queue in self._queues:
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+
+        self._queues = []
+        self._tasks = []
+        self._in_flight = []
+
+        return [
+            {
+                "chat_id": chat_id,
+                "text": text,
+                "reply_markup": reply_markup.to_dict() if reply_markup else None,
+                "queued_at": queued_at,
+            }
+            for _, chat_id, text, reply_markup, queued_at in pending
+        ]
+
+    def restore(self, bot: Bot, pending: list, max_age: float) -> int:
+        """Поставить в очередь сообщения, сохранённые при остановке.
+
+        Сообщения старше max_age секунд (например, о давно закончившемся
+        раунде) отбрасываются. Возвращает число поставленных в очередь.
+        """
+        restored = 0
+        now = time.time()
+        for message in pending:
+            if now - message.get("queued_at", 0) > max_age:
+                continue
+            reply_markup = None
+            if message["reply_markup"]:
+                reply_markup = InlineKeyboardMarkup.de_json(message["reply_markup"], bot)
+            self.put(bot, message["chat_id"], message["text"], reply_markup, message["queued_at"])
+            restored += 1
+        return restored
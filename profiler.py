@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер работающего процесса.
+
+    Пока профиль снимается, отдельный поток через заданный интервал читает стек
+    потока с циклом событий и складывает его в счётчик. В корень стека
+    добавляется имя текущей задачи asyncio, так что время раскладывается по
+    обработчикам и корутинам. Параллельно меряется задержка цикла событий.
+    Результат пишется в формате collapsed stacks (flamegraph.pl, speedscope).
+
+    Когда профиль не снимается, профайлер ничего не делает.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.running = False
+
+    def _frame_stack(self, frame) -> list:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _sample_loop(self, loop, thread_id: int, stop: threading.Event, samples: Counter):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(loop)
+            root = f"task:{task.get_name()}" if task else "event_loop"
+            samples[";".join([root] + self._frame_stack(frame))] += 1
+
+    async def _measure_lag(self, stop: threading.Event, lags: list):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lags.append(max(0.0, loop.time() - started - self.interval))
+
+    def reserve(self) -> bool:
+        """Занять профайлер до запуска profile(); False, если профиль уже снимается"""
+        if self.running:
+            return False
+        self.running = True
+        return True
+
+    async def profile(self, duration: float) -> dict:
+        """Снять профиль длительностью duration секунд и записать его в файл.
+
+        Профайлер должен быть заранее занят через reserve().
+        """
+        stop = threading.Event()
+        try:
+            loop = asyncio.get_running_loop()
+            samples = Counter()
+            lags = []
+
+            sampler = threading.Thread(
+                target=self._sample_loop,
+                args=(loop, threading.get_ident(), stop, samples),
+                name="sampling-profiler",
+                daemon=True,
+            )
+            lag_task = asyncio.create_task(self._measure_lag(stop, lags), name="profiler-lag")
+            sampler.start()
+            await asyncio.sleep(duration)
+            stop.set()
+            await lag_task
+            await asyncio.to_thread(sampler.join)
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        finally:
+            # Поток сэмплирования останавливаем и при ошибке
+            stop.set()
+            self.running = False
+
+        lags.sort()
+        return {
+            "path": path,
+            "samples": sum(samples.values()),
+            "lag_mean_ms": sum(lags) / len(lags) * 1000 if lags else 0.0,
+            "lag_p99_ms": lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000 if lags else 0.0,
+            "lag_max_ms": lags[-1] * 1000 if lags else 0.0,
+        }
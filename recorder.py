@@ -0,0 +1,69 @@
+import json
+import random
+import time
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+
+class UpdateRecorder:
+    """Запись входящих обновлений в компактный журнал (JSON Lines).
+
+    Журнал дописывается при каждом запуске бота. Каждый запуск начинается
+    с заголовка (зерно генератора случайных чисел, имя бота и, если бот
+    восстановил игры после перезапуска, их начальное состояние), далее идёт
+    по строке на обновление: {"t": время, "u": обновление}.
+    Журнал воспроизводится скриптом replay.py.
+    """
+
+    def __init__(self, path: str, seed: int = None):
+        self.path = path
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        # Фиксируем зерно, чтобы при воспроизведении совпали ID лобби,
+        # выбор шпиона и места работы
+        random.seed(self.seed)
+        self._file = open(path, "a", encoding="utf-8")
+        self._header_written = False
+        self._initial_state = None
+
+    def set_initial_state(self, state: str):
+        """Запомнить восстановленное состояние игр для заголовка журнала"""
+        self._initial_state = state
+
+    def _write(self, entry: dict):
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def _header(self, bot_username: str) -> dict:
+        header = {"seed": self.seed, "bot_username": bot_username}
+        if self._initial_state is not None:
+            header["state"] = self._initial_state
+        return header
+
+    async def record(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик, записывающий каждое обновление в журнал"""
+        if not self._header_written:
+            self._write(self._header(context.bot.username))
+            self._header_written = True
+        self._write({"t": round(time.time(), 3), "u": update.to_dict()})
+
+    def close(self):
+        self._file.close()
+
+
+def read_log(path: str) -> list:
+    """Прочитать журнал: список запусков вида {"header": ..., "entries": [(время, обновление)]}"""
+    segments = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "u" in entry:
+                if not segments:
+                    segments.append({"header": {}, "entries": []})
+                segments[-1]["entries"].append((entry["t"], entry["u"]))
+            else:
+                segments.append({"header": entry, "entries": []})
+    return segments
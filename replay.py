@@ -0,0 +1,195 @@
+"""Воспроизведение журнала обновлений, записанного ботом (SPY_RECORD_FILE).
+
+Обновления прогоняются через те же обработчики Application, но вместо
+Telegram Bot API используется подставной запрос, который только считает
+вызовы. В конце печатается задержка по обработчикам и число вызовов API,
+чтобы сравнивать производительность разных версий бота.
+
+Пример:
+    python replay.py updates.jsonl --speed max --json report.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+import bot
+from game_logic import GameManager
+from recorder import read_log
+from snapshot import loads_game_manager
+
+
+class FakeRequest(BaseRequest):
+    """Подставной запрос к Bot API: ничего не отправляет, только считает вызовы"""
+
+    def __init__(self, bot_username: str = "spy_replay_bot"):
+        self.bot_username = bot_username
+        self.calls = Counter()
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Spy",
+                "username": self.bot_username,
+            }
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = params.get("chat_id", 0)
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        params = request_data.parameters if request_data else {}
+        body = {"ok": True, "result": self._result(api_method, params)}
+        return 200, json.dumps(body).encode("utf-8")
+
+
+def handler_name(application: Application, update: Update) -> str:
+    """Имя обработчика, который сработает на обновление"""
+    for group in sorted(application.handlers):
+        if group < 0:
+            continue
+        for handler in application.handlers[group]:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler.callback.__name__
+    return "<none>"
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * fraction))
+    return ordered[index]
+
+
+async def replay(path: str, speed: str = "max", seed: int = None) -> dict:
+    """Прогнать журнал через обработчики бота и собрать статистику.
+
+    Каждый запуск бота из журнала воспроизводится отдельно, со своим зерном
+    и с тем состоянием игр, с которого он начался (пустым или восстановленным).
+    """
+    segments = read_log(path)
+    bot_username = next(
+        (segment["header"]["bot_username"] for segment in segments if segment["header"].get("bot_username")),
+        "spy_replay_bot",
+    )
+
+    request = FakeRequest(bot_username)
+    application = Application.builder().token("1:replay").request(request).updater(None).build()
+    bot.register_handlers(application)
+
+    latencies = defaultdict(list)
+    api_calls = defaultdict(Counter)
+    seeds = []
+
+    async with application:
+        for segment in segments:
+            segment_seed = seed if seed is not None else segment["header"].get("seed", 0)
+            seeds.append(segment_seed)
+            random.seed(segment_seed)
+            if "state" in segment["header"]:
+                bot.game_manager = loads_game_manager(segment["header"]["state"])
+            else:
+                bot.game_manager = GameManager()
+            bot.role_messages.clear()
+
+            previous_t = None
+            for t, data in segment["entries"]:
+                if speed == "realtime" and previous_t is not None:
+                    await asyncio.sleep(max(0.0, t - previous_t))
+                previous_t = t
+
+                update = Update.de_json(data, application.bot)
+                name = handler_name(application, update)
+                calls_before = request.calls.copy()
+
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies[name].append(time.perf_counter() - started)
+
+                # Рассылки уходят через очередь - дожидаемся их, чтобы учесть вызовы API
+                await bot.outbox.join()
+                api_calls[name].update(request.calls - calls_before)
+
+    updates = sum(len(segment["entries"]) for segment in segments)
+    report = {"seeds": seeds, "updates": updates, "handlers": {}}
+    for name, values in sorted(latencies.items()):
+        report["handlers"][name] = {
+            "count": len(values),
+            "total_ms": round(sum(values) * 1000, 3),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "max_ms": round(max(values) * 1000, 3),
+            "api_calls": dict(api_calls[name]),
+        }
+    return report
+
+
+def print_report(report: dict):
+    seeds = ", ".join(str(seed) for seed in report["seeds"])
+    print(f"Обновлений: {report['updates']}, запусков: {len(report['seeds'])}, seed: {seeds}\n")
+    print(f"{'Обработчик':<16}{'кол-во':>8}{'сред, мс':>11}{'p95, мс':>10}{'макс, мс':>10}  вызовы API")
+    for name, stats in report["handlers"].items():
+        calls = ", ".join(f"{method}={count}" for method, count in sorted(stats["api_calls"].items()))
+        print(
+            f"{name:<16}{stats['count']:>8}{stats['mean_ms']:>11.3f}"
+            f"{stats['p95_ms']:>10.3f}{stats['max_ms']:>10.3f}  {calls}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение журнала обновлений бота")
+    parser.add_argument("log", help="файл журнала, записанный через SPY_RECORD_FILE")
+    parser.add_argument("--speed", choices=["max", "realtime"], default="max",
+                        help="скорость воспроизведения (по умолчанию max)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="зерно генератора случайных чисел (по умолчанию из журнала)")
+    parser.add_argument("--json", dest="json_path", default=None,
+                        help="сохранить отчёт в JSON для сравнения версий")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.log, speed=args.speed, seed=args.seed))
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
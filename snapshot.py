@@ -0,0 +1,52 @@
+import base64
+import os
+import pickle
+
+# Версия формата файла состояния; при несовместимых изменениях увеличивается
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, game_manager, pending: list):
+    """Сохранить состояние игр и неотправленные сообщения"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": SNAPSHOT_VERSION, "game_manager": game_manager, "pending": pending}, f)
+    # Атомарная замена, чтобы не оставить наполовину записанный файл
+    os.replace(tmp_path, path)
+
+
+def dumps_game_manager(game_manager) -> str:
+    """Состояние игр в виде строки (для заголовка журнала replay.py)"""
+    data = pickle.dumps({"version": SNAPSHOT_VERSION, "game_manager": game_manager})
+    return base64.b64encode(data).decode("ascii")
+
+
+def loads_game_manager(data: str):
+    """Восстановить состояние игр из строки dumps_game_manager"""
+    state = pickle.loads(base64.b64decode(data))
+    if state.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"неподдерживаемая версия формата: {state.get('version')}")
+    return state["game_manager"]
+
+
+def load_snapshot(path: str):
+    """Загрузить сохранённое состояние и удалить файл.
+
+    Возвращает None, если файла нет или его не удалось прочитать (например,
+    после изменения классов game_logic). Нечитаемый файл переносится в .bad,
+    чтобы бот мог запуститься.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"неподдерживаемая версия формата: {snapshot.get('version')}")
+    except Exception as e:
+        bad_path = path + ".bad"
+        os.replace(path, bad_path)
+        print(f"❌ Не удалось загрузить состояние из {path}: {e}. Файл перенесён в {bad_path}")
+        return None
+    os.remove(path)
+    return snapshot
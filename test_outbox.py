@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from telegram.error import Forbidden, TimedOut
+
+from outbox import Outbox
+
+
+class FakeBot:
+    """Бот, который записывает отправленные сообщения и может падать по сценарию"""
+
+    def __init__(self, errors=None, delay: float = 0.0):
+        self.sent = []
+        self.calls = 0
+        self.errors = list(errors or [])
+        self.delay = delay
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def test_drain_returns_queued_and_in_flight():
+    async def scenario():
+        outbox = Outbox(workers=1)
+        bot = FakeBot(delay=10)
+        outbox.put(bot, 1, "первое")
+        outbox.put(bot, 1, "второе")
+        await asyncio.sleep(0)
+        return await outbox.drain(0.05)
+
+    pending = asyncio.run(scenario())
+
+    assert [message["text"] for message in pending] == ["первое", "второе"]
+    assert all(message["chat_id"] == 1 for message in pending)
+
+
+def test_forbidden_is_dropped():
+    async def scenario():
+        outbox = Outbox(workers=1)
+        bot = FakeBot(errors=[Forbidden("bot was blocked by the user")])
+        outbox.put(bot, 1, "заблокирован")
+        outbox.put(bot, 1, "следующее")
+        await outbox.join()
+        return bot, await outbox.drain(0)
+
+    bot, pending = asyncio.run(scenario())
+
+    assert bot.sent == [(1, "следующее")]
+    assert pending == []
+
+
+def test_network_error_retried_then_sent():
+    async def scenario():
+        outbox = Outbox(workers=1, max_retries=3, retry_delay=0.001)
+        bot = FakeBot(errors=[TimedOut(), TimedOut()])
+        outbox.put(bot, 1, "результат")
+        await outbox.join()
+        return bot, await outbox.drain(0)
+
+    bot, pending = asyncio.run(scenario())
+
+    assert bot.calls == 3
+    assert bot.sent == [(1, "результат")]
+    assert pending == []
+
+
+def test_unexpected_error_is_not_kept():
+    async def scenario():
+        outbox = Outbox(workers=1, max_retries=1, retry_delay=0.001)
+        bot = FakeBot(errors=[ValueError("boom"), TimedOut(), TimedOut()])
+        outbox.put(bot, 1, "сломанное")
+        outbox.put(bot, 1, "недоставленное")
+        await outbox.join()
+        return await outbox.drain(0)
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_restore_skips_stale_messages():
+    async def scenario():
+        outbox = Outbox(workers=1)
+        bot = FakeBot()
+        pending = [
+            {"chat_id": 1, "text": "старое", "reply_markup": None, "queued_at": time.time() - 1000},
+            {"chat_id": 1, "text": "свежее", "reply_markup": None, "queued_at": time.time()},
+        ]
+        restored = outbox.restore(bot, pending, max_age=300)
+        await outbox.join()
+        await outbox.drain(0)
+        return bot, restored
+
+    bot, restored = asyncio.run(scenario())
+
+    assert restored == 1
+    assert bot.sent == [(1, "свежее")]
@@ -0,0 +1,28 @@
+import os
+
+from snapshot import load_snapshot, save_snapshot
+
+
+def test_save_and_load_removes_file(tmp_path):
+    path = str(tmp_path / "state.pkl")
+    save_snapshot(path, {"lobbies": {}}, [{"chat_id": 1, "text": "привет"}])
+
+    snapshot = load_snapshot(path)
+
+    assert snapshot["game_manager"] == {"lobbies": {}}
+    assert snapshot["pending"] == [{"chat_id": 1, "text": "привет"}]
+    assert not os.path.exists(path)
+
+
+def test_missing_file_returns_none(tmp_path):
+    assert load_snapshot(str(tmp_path / "state.pkl")) is None
+
+
+def test_bad_file_is_moved_aside(tmp_path):
+    path = str(tmp_path / "state.pkl")
+    with open(path, "wb") as f:
+        f.write(b"not a pickle")
+
+    assert load_snapshot(path) is None
+    assert not os.path.exists(path)
+    assert os.path.exists(path + ".bad")